@@ -1,12 +1,14 @@
-from flask import Flask, request, make_response # Handle requests
+from flask import Flask, request # Handle requests
 from time  import time # Time measurements
-from os import urandom # Randomness for user creation
+from threading import local, Lock # Per-thread reuse of request objects, shared state
 
 import Messages_pb2 # Import the protocol buffer definitions
+from google.protobuf.internal import api_implementation # Check the protobuf backend
 
 # Import the bucket and user set classes
 from userSet import UserSet, ExpiringUserSet
 from bucket import Bucket
+from identifiers import randomIdentifiers
 from errors import ICDError, AuthenticationError, RateLimitError, MissingDataError, InvalidDataError
 
 # MARK: Configuration
@@ -17,17 +19,24 @@ s2_period = 86400
 # The time interval for which contacts remain in set S2 (in seconds)
 s2_delta = 864000
 
+# The time interval in which expired users are removed from set S2 (in seconds)
+# Between these updates, expired users are ignored when checking contacts.
+s2_update_interval = s2_period // 10
+
 # The maximum amount of contacts for each user
 # This number will specify the leak rate as follows:
 # S1 will allow 'max_contacts' checks every 's2_delta' seconds
 # S2 will allow 'max_contacts' checks every 's2_period' seconds
 max_contacts = 20000
 
+# The length of the identifiers (in bytes) sent in the packed field of a request
+identifier_length = 16
+
 # MARK: Variables
 
 # Set S1: All registered users
 # The keys are the identifiers of all registered users
-# The values are their authentication tokens
+# The values are the hashes of their authentication tokens
 s1 = UserSet()
 
 # Set S2: All users registered in the last 's2_delta' seconds.
@@ -40,6 +49,8 @@ s2_added = ExpiringUserSet(expiration_time=s2_delta)
 # The values are the time when they should be removed from the set
 s2_removed = ExpiringUserSet(expiration_time=s2_delta)
 
+# The time when expired users are removed from S2 the next time
+_nextUpdateTime = 0
 
 # S1 buckets: The bucket values for all registered users when doing a full sync
 # The keys are the user identifiers, the values are the timestamps when the
@@ -62,9 +73,60 @@ s2_buckets = Bucket(max_contacts, drain_period=s2_period)
 # The flask application to facilitate contact discovery
 application = Flask(__name__)
 
+# The lock for all changes to the user sets and buckets, which are shared by all threads
+# Parsing requests and creating responses is done without holding the lock.
+_stateLock = Lock()
+
+# Thread-local storage for objects reused across requests
+# Each thread keeps a single 'Messages_pb2.Request' to parse received data into
+_threadData = local()
+
 
 # MARK: Responses
 
+# The serialized responses without any users never change, so they are only created once.
+# The keys are the result codes, the values are the serialized responses.
+_serializedResults = {
+    result: Messages_pb2.Response(result=result).SerializeToString()
+    for result in Messages_pb2.Result.values()
+}
+
+def _makeProtobufResponse(serialized):
+    """
+    Wrap a serialized protobuf object in a response.
+
+    The data is passed to the response class directly,
+    which keeps a reference to it instead of copying it.
+
+    Parameters
+    ----------
+    serialized: bytes
+        The serialized 'Messages_pb2.Response'
+
+    Returns
+    -------
+    response_class
+        The response for the client
+    """
+    return application.response_class(serialized, mimetype='application/x-protobuf')
+
+# Create a response without users
+def _makeResultResponse(result):
+    """
+    Create a response with only a result code.
+
+    Parameters
+    ----------
+    result: Messages_pb2.Result
+        The result of the request
+
+    Returns
+    -------
+    response_class
+        The response for the client
+    """
+    return _makeProtobufResponse(_serializedResults[result])
+
 # Create an error to send for a full sync request
 def _makeErrorResponse(error : ICDError):
     """
@@ -80,11 +142,7 @@ def _makeErrorResponse(error : ICDError):
     response_class
         The response for the client
     """
-    response = Messages_pb2.Response()
-    response.result = error.result
-    serialized = response.SerializeToString()
-    data = make_response(serialized)
-    return data
+    return _makeResultResponse(error.result)
 
 # Create a new response with the discovery result
 def _makeResponse(added = [], removed = []):
@@ -103,25 +161,56 @@ def _makeResponse(added = [], removed = []):
     response_class
         The response for the client
     """
-    response = Messages_pb2.Response()
-    response.result = Messages_pb2.Result.SUCCESS
-    response.added_users.extend(added)
-    response.removed_users.extend(removed)
-    serialized = response.SerializeToString()
-    data = make_response(serialized)
-    return data
+    if not added and not removed:
+        return _makeResultResponse(Messages_pb2.Result.SUCCESS)
+    # Fill all fields on construction, so that the native protobuf backend
+    # copies the users in one call and serializes into a buffer of the final size
+    response = Messages_pb2.Response(result=Messages_pb2.Result.SUCCESS,
+                                     added_users=added,
+                                     removed_users=removed)
+    return _makeProtobufResponse(response.SerializeToString())
 
 
 # MARK: Authentication
 
+def _unpackIdentifiers(identifiers, packed):
+    """
+    Add concatenated identifiers of fixed length to a set of identifiers.
+
+    Parameters
+    ----------
+    identifiers: frozenset
+        The identifiers from the repeated field of the request
+    packed: bytes
+        The identifiers, each of length 'identifier_length'
+
+    Returns
+    -------
+    frozenset
+        The unique identifiers of both fields
+
+    Exceptions
+    ----------
+    InvalidDataError
+        The length of the data is not a multiple of 'identifier_length'
+    """
+    if not packed:
+        return identifiers
+    if len(packed) % identifier_length != 0:
+        raise InvalidDataError()
+    return identifiers | frozenset(packed[i:i + identifier_length] for i in range(0, len(packed), identifier_length))
+
 def _getDataFromRequest():
     """
     Extract user, auth_token and identifiers from the request.
 
+    The packed identifiers are returned unchanged,
+    so that their size can be checked before they are split.
+
     Returns
     ----------
     tuple
-        User identifier, authentication token, identifiers
+        User identifier, authentication token, set of unique identifiers, packed identifiers
 
     Exceptions
     ----------
@@ -135,13 +224,21 @@ def _getDataFromRequest():
     if data is None:
         raise MissingDataError()
 
-    # Try to create the protobuf object
-    received_request = Messages_pb2.Request()
+    # Reuse the protobuf object of this thread, or create it for the first request
+    received_request = getattr(_threadData, 'request', None)
+    if received_request is None:
+        received_request = Messages_pb2.Request()
+        _threadData.request = received_request
+
+    # Try to fill the protobuf object
+    received_request.Clear()
     try:
-        received_request.ParseFromString(data)
+        received_request.MergeFromString(data)
     except:
         raise InvalidDataError()
-    return received_request.user, received_request.auth_token, received_request.identifiers
+    # Convert the identifiers once, the set is used for the rate limit and the discovery
+    identifiers = frozenset(received_request.identifiers)
+    return received_request.user, received_request.auth_token, identifiers, received_request.identifiers_packed
 
 def _checkAuthentication():
     """
@@ -150,7 +247,7 @@ def _checkAuthentication():
     Returns
     ----------
     tuple
-        The user identifier and a list of contact identifiers
+        The user identifier, a set of contact identifiers, and the packed contact identifiers
 
     Exceptions
     ----------
@@ -161,11 +258,11 @@ def _checkAuthentication():
     AuthenticationError
         The user identifier or authentication token is invalid
     """
-    user, auth_token, identifiers = _getDataFromRequest()
+    user, auth_token, identifiers, packed = _getDataFromRequest()
     # Check that the user exists, and that the authentication is valid
     if not s1.isValidUser(user, auth_token):
         raise AuthenticationError()
-    return user, identifiers
+    return user, identifiers, packed
 
 def _checkAuthenticationAndExtractIdentifiers():
     """
@@ -174,21 +271,26 @@ def _checkAuthenticationAndExtractIdentifiers():
     Returns
     -------
     tuple
-        The user and the list of identifiers provided by the user
+        The user and the set of identifiers provided by the user
 
     Exceptions
     ----------
     MissingDataError
         The request contains no body data
     InvalidDataError
-        The received body data is not a valid protobuf object
+        The received body data is not a valid protobuf object,
+        or the packed identifiers have an invalid length
     AuthenticationError
         The user identifier or authentication token is invalid
     RateLimitError
         The user has exceeded his capacity to sync
     """
-    user, identifiers = _checkAuthentication()
+    user, identifiers, packed = _checkAuthentication()
 
+    # Check the size of the packed identifiers before splitting them
+    if len(packed) > max_contacts * identifier_length:
+        raise RateLimitError()
+    identifiers = _unpackIdentifiers(identifiers, packed)
     if len(identifiers) > max_contacts:
         raise RateLimitError()
     return user, identifiers
@@ -207,7 +309,7 @@ def _time():
     """
     return int(time())
 
-def addNewUser(user, auth_token):
+def addNewUser(user, auth_token, currentTime : int):
     """
     Register a new user.
 
@@ -217,16 +319,19 @@ def addNewUser(user, auth_token):
         The users identifier
     auth_token: bytes
         The authentication token of the user
+    currentTime: int
+        The current time in seconds since epoch
     """
-    # Add to S1
-    s1.addUser(user, auth_token)
-    # Add to the set of added users
-    # The value is the time when the user should be removed from the set
-    s2_added.addUser(user, _time())
-    # Remove from unregistered users, just in case the user was recently deleted
-    s2_removed.removeUser(user)
-
-def removeUser(user):
+    with _stateLock:
+        # Add to S1
+        s1.addUser(user, auth_token)
+        # Add to the set of added users
+        # The value is the time when the user should be removed from the set
+        s2_added.addUser(user, currentTime)
+        # Remove from unregistered users, just in case the user was recently deleted
+        s2_removed.removeUser(user)
+
+def removeUser(user, currentTime : int):
     """
     Remove a registered user.
 
@@ -234,30 +339,65 @@ def removeUser(user):
     ----------
     user: bytes
         The users identifier
+    currentTime: int
+        The current time in seconds since epoch
+    """
+    with _stateLock:
+        # Remove the user from the full set
+        s1.removeUser(user)
+        # Remove from new users, just in case the user was recently added
+        s2_added.removeUser(user)
+        # Add the user to the set of unregistered users
+        # The value is the time when the user should be removed from the set
+        s2_removed.addUser(user, currentTime)
+
+def addNewUsers(users, currentTime : int):
+    """
+    Register many new users at once.
+
+    Parameters
+    ----------
+    users: dict
+        The identifiers of the users as keys, their authentication tokens as values
+    currentTime: int
+        The current time in seconds since epoch
     """
-    # Remove the user from the full set
-    s1.removeUser(user)
-    # Remove from new users, just in case the user was recently added
-    s2_added.removeUser(user)
-    # Add the user to the set of unregistered users
-    # The value is the time when the user should be removed from the set
-    s2_removed.addUser(user, _time())
+    with _stateLock:
+        s1.addUsers(users)
+        s2_added.addUsers(users, currentTime)
+        s2_removed.removeUsers(users)
 
 # MARK: Set updates
 
-def _updateUserSets():
-    """ Remove expired users from S_2 """
-    currentTime = _time()
-    removedFromAdded = s2_added.update(currentTime)
-    removedFromRemoved = s2_removed.update(currentTime)
+def _updateUserSets(currentTime : int):
+    """
+    Remove expired users from S_2 and drained buckets, if 's2_update_interval' has elapsed.
+
+    Parameters
+    ----------
+    currentTime: int
+        The current time in seconds since epoch
+    """
+    global _nextUpdateTime
+    # Check and set the time while holding the lock, so that only one thread runs the update
+    with _stateLock:
+        if currentTime < _nextUpdateTime:
+            return
+        _nextUpdateTime = currentTime + s2_update_interval
+        removedFromAdded = s2_added.update(currentTime)
+        removedFromRemoved = s2_removed.update(currentTime)
+        s1_buckets.cleanUsers(currentTime)
+        s2_buckets.cleanUsers(currentTime)
 
 # MARK: Request entry points
 
 def _catchRequestErrors(callback):
+    # Use the same time for all checks during the request
+    currentTime = time()
     # Update all sets to the current time
-    _updateUserSets()
+    _updateUserSets(int(currentTime))
     try:
-        return callback()
+        return callback(currentTime)
     except ICDError as e:
         return _makeErrorResponse(e)
 
@@ -266,10 +406,15 @@ def _catchRequestErrors(callback):
 def fullDiscovery():
     return _catchRequestErrors(_fullDiscoveryWithErrors)
 
-def _fullDiscoveryWithErrors():
+def _fullDiscoveryWithErrors(currentTime : float):
     """
     Perform a full sync with S1.
 
+    Parameters
+    ----------
+    currentTime: float
+        The current time in seconds since epoch
+
     Returns
     -------
     bytes
@@ -291,12 +436,14 @@ def _fullDiscoveryWithErrors():
     if len(identifiers) == 0:
         return _makeResponse()
 
-    # Check the rate limit
-    if not s1_buckets.userCanSyncAmount(user, amount=len(identifiers), time=time()):
-        raise RateLimitError()
+    with _stateLock:
+        # Check the rate limit
+        # Exceeding it is common, so the response is returned without raising an error
+        if not s1_buckets.userCanSyncAmount(user, amount=len(identifiers), time=currentTime):
+            return _makeResultResponse(Messages_pb2.Result.RATE_LIMIT_EXCEEDED)
 
-    # Now do the actual discovery
-    found = s1.containedUsers(identifiers)
+        # Now do the actual discovery
+        found = s1.containedUsersSet(identifiers)
     return _makeResponse(found)
 
 # Initiates an incremental sync with S2.
@@ -312,10 +459,15 @@ def incrementalDiscovery():
     """
     return _catchRequestErrors(_incrementalDiscoveryWithErrors)
 
-def _incrementalDiscoveryWithErrors():
+def _incrementalDiscoveryWithErrors(currentTime : float):
     """
     Perform an incremental sync with S2.
 
+    Parameters
+    ----------
+    currentTime: float
+        The current time in seconds since epoch
+
     Returns
     -------
     response_class
@@ -337,13 +489,16 @@ def _incrementalDiscoveryWithErrors():
     if len(identifiers) == 0:
         return _makeResponse()
 
-    # Check the rate limit
-    if not s2_buckets.userCanSyncAmount(user, amount=len(identifiers), time=time()):
-        raise RateLimitError()
+    with _stateLock:
+        # Check the rate limit
+        # Exceeding it is common, so the response is returned without raising an error
+        if not s2_buckets.userCanSyncAmount(user, amount=len(identifiers), time=currentTime):
+            return _makeResultResponse(Messages_pb2.Result.RATE_LIMIT_EXCEEDED)
 
-    # Now do the actual discovery
-    addedUsers = s2_added.containedUsers(identifiers)
-    removedUsers = s2_removed.containedUsers(identifiers)
+        # Now do the actual discovery
+        # The user sets use whole seconds
+        addedUsers = s2_added.containedUsersSet(identifiers, time=int(currentTime))
+        removedUsers = s2_removed.containedUsersSet(identifiers, time=int(currentTime))
     return _makeResponse(addedUsers, removedUsers)
 
 @application.route("/user/register", methods=['POST'])
@@ -356,9 +511,9 @@ def registerUser():
     """
     return _catchRequestErrors(_registerUserWithErrors)
 
-def _registerUserWithErrors():
-    user, auth_token, _ = _getDataFromRequest()
-    addNewUser(user, auth_token)
+def _registerUserWithErrors(currentTime : float):
+    user, auth_token, _, _ = _getDataFromRequest()
+    addNewUser(user, auth_token, int(currentTime))
     return _makeResponse()
 
 @application.route("/user/delete", methods=['POST'])
@@ -371,21 +526,26 @@ def deleteUser():
     """
     return _catchRequestErrors(_deleteUserWithErrors)
 
-def _deleteUserWithErrors():
-    user, _ = _checkAuthentication()
-    removeUser(user)
+def _deleteUserWithErrors(currentTime : float):
+    user, _, _ = _checkAuthentication()
+    removeUser(user, int(currentTime))
     return _makeResponse()
 
 
 # MARK: Test functions
 
+# The number of users created at once by 'createUsers'
+_creationBlockSize = 100000
+
+
 @application.route("/reset", methods=['GET'])
 def resetServer():
-    s1_buckets.clear()
-    s2_buckets.clear()
-    s1.clear()
-    s2_added.clear()
-    s2_removed.clear()
+    with _stateLock:
+        s1_buckets.clear()
+        s2_buckets.clear()
+        s1.clear()
+        s2_added.clear()
+        s2_removed.clear()
     return "Success"
 
 @application.route("/test/create/<int:number>", methods=['GET'])
@@ -394,18 +554,21 @@ def createUsers(number):
         print("{:d} is too many users to create".format(number))
         return "Too many"
     print("Creating {:d} users...".format(number))
-    for i in range(number):
-        user = urandom(16)
-        token = urandom(16)
-        addNewUser(user, token)
+    currentTime = _time()
+    # Create the users in blocks, to limit the memory for the random data
+    for start in range(0, number, _creationBlockSize):
+        count = min(_creationBlockSize, number - start)
+        users = randomIdentifiers(count, identifier_length)
+        tokens = randomIdentifiers(count, identifier_length)
+        addNewUsers(dict(zip(users, tokens)), currentTime)
     return "Success"
 
 @application.route("/test/add/many", methods=['POST'])
 def addUsers():
-    _, _, ids = _getDataFromRequest()
-    for id in ids:
-        token = urandom(16)
-        addNewUser(id, token)
+    _, _, ids, packed = _getDataFromRequest()
+    ids = _unpackIdentifiers(ids, packed)
+    tokens = randomIdentifiers(len(ids), identifier_length)
+    addNewUsers(dict(zip(ids, tokens)), _time())
     return _makeResponse()
 
 
@@ -415,6 +578,9 @@ print("Incremental discovery service is ready...")
 print("Maximum contacts: {:d}".format(max_contacts))
 print("Full sync: {:d} contacts per {:d} seconds ({:.3f} contacts/s)".format(max_contacts, s2_delta, s1_buckets.leak_rate))
 print("Incremental sync: {:d} contacts per day ({:.3f} contacts/s)".format(max_contacts, s2_buckets.leak_rate))
+print("Protocol buffer implementation: {}".format(api_implementation.Type()))
+if api_implementation.Type() not in ('cpp', 'upb'):
+    print("Warning: Using the pure-Python protobuf implementation, install protobuf>=4.21 for native parsing")
 
 if __name__ == "__main__":
     application.run()
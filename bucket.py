@@ -27,6 +27,9 @@ class Bucket:
         Remove all data from the set.
     """
 
+    # Fixed attributes avoid the instance dictionary on every access
+    __slots__ = ('_users', 'leak_rate', 'max_count', 'drain_period', '_time_per_contact')
+
     def userCount(self):
         """ Get the number of users in the set. """
         return len(self._users)
@@ -46,6 +49,8 @@ class Bucket:
         self.leak_rate = float(max_count) / float(drain_period)
         self.max_count = max_count
         self.drain_period = float(drain_period)
+        # The time (in seconds) the bucket needs to drain a single contact
+        self._time_per_contact = float(drain_period) / float(max_count)
 
     def currentSizeForUser(self, user, time : float):
         """
@@ -63,12 +68,12 @@ class Bucket:
         int
             The current bucket state of the user (between 0 and 'max_count')
         """
-        timestamp = self._users.get(user)
-        if timestamp is None:
+        # Users without a bucket and users with a drained bucket have an empty bucket
+        timestamp = self._users.get(user, time)
+        if timestamp <= time:
             return 0
-        if timestamp < time:
-            return self.max_count
-        return int(ceil((timestamp - time) * self.leak_rate))
+        # 'ceil' already returns an int
+        return ceil((timestamp - time) * self.leak_rate)
 
     def userCanSyncAmount(self, user, amount : int, time : float):
         """
@@ -91,22 +96,15 @@ class Bucket:
         # Request larger than the maximum allowed count always fail
         if amount > self.max_count:
             return False
-        # Get the point in time when the bucket for the user will be empty
-        timestamp = self._users.get(user)
-        # If the user has no bucket yet, then sync is allowed
-        if timestamp is None:
-            # Calculate new point in time when bucket will be empty
-            self._users[user] = time + amount / self.leak_rate
-            return True
-        # If bucket is already empty, then sync is allowed
-        if timestamp < time:
-            # Calculate new point in time when bucket will be empty
-            self._users[user] = time + amount / self.leak_rate
-            return True
-        # Calculate new point in time when bucket would be empty
-        timestamp += amount / self.leak_rate
-        # If time is further than 'drain_period' in the future, bucket size would be exceeded
-        if timestamp > time + self.drain_period:
+        # Get the point in time when the bucket for the user will be empty.
+        # Users without a bucket and users with an already empty bucket start at the current time.
+        # Then calculate the new point in time when the bucket would be empty
+        start = max(self._users.get(user, time), time)
+        timestamp = start + amount * self._time_per_contact
+        # If time is further than 'drain_period' in the future, bucket size would be exceeded.
+        # An empty bucket always fits 'max_count', which is not checked here,
+        # since the drain time can be rounded to slightly more than 'drain_period'
+        if start != time and timestamp > time + self.drain_period:
             return False
         # Set new timestamp before actual sync is done
         self._users[user] = timestamp
@@ -122,7 +120,13 @@ class Bucket:
         time : float
             The current time in seconds since epoch.
         """
-        self._users = {k: v for k, v in self._users.items() if v > time }
+        expired = [k for k, v in self._users.items() if v <= time]
+        # Deleting entries never shrinks a dictionary, so rebuild it if most users are removed
+        if 2 * len(expired) > len(self._users):
+            self._users = {k: v for k, v in self._users.items() if v > time }
+            return
+        for k in expired:
+            del self._users[k]
 
     def clear(self):
         """ Remove all data from the set. """
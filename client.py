@@ -2,11 +2,15 @@ from os import urandom
 
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
 
 import Messages_pb2
 
 urllib3.disable_warnings()
 
+# The length of identifiers (in bytes) which can be sent packed into a single field
+identifier_length = 16
+
 class Client:
     """
     A simple client to facilitate contact discovery.
@@ -14,9 +18,11 @@ class Client:
     Attributes
     ----------
     user : bytes
-        The user identifier.
+        The user identifier (fixed after creation).
     auth_token : bytes
-        The authentication token of the user.
+        The authentication token of the user (fixed after creation).
+    session : requests.Session
+        The session which keeps the connections to the server open.
 
     Methods
     -------
@@ -47,6 +53,12 @@ class Client:
             self.user = user
         self.auth_token = urandom(16)
         self.server = server
+        # Reuse connections for all requests to the server
+        self.session = requests.Session()
+        self.session.mount(server, HTTPAdapter(pool_connections=1, pool_maxsize=16))
+        self.session.headers['Content-Type'] = 'application/x-protobuf'
+        # The user info is the same for all requests, so it is only serialized once
+        self._userData = self._makeProtobuf().SerializeToString()
 
     def _makeProtobuf(self):
         """ Create a protobuf object containing the user and the token. """
@@ -57,14 +69,20 @@ class Client:
 
     def _makeProtobufData(self):
         """ Create a serialized protobuf with the user info. """
-        protobuf = self._makeProtobuf()
-        return protobuf.SerializeToString()
+        return self._userData
 
     def _makeProtobufWithContacts(self, contacts):
         """ Create a serialized protobuf request with contacts. """
-        protobuf = self._makeProtobuf()
-        protobuf.identifiers.extend(contacts)
-        return protobuf.SerializeToString()
+        protobuf = Messages_pb2.Request()
+        # The contacts are read twice, so an iterator must not be used up by the first pass
+        contacts = list(contacts)
+        # Concatenate the contacts if possible, which is faster to encode and decode
+        if set(map(len, contacts)) <= {identifier_length}:
+            protobuf.identifiers_packed = b''.join(contacts)
+        else:
+            protobuf.identifiers.extend(contacts)
+        # Concatenated protobuf messages are parsed as a single merged message
+        return self._userData + protobuf.SerializeToString()
 
     def _post(self, url, data, printError=True):
         """
@@ -82,7 +100,7 @@ class Client:
         Messages_pb2.Response
             The response from the server, or None if the request failed.
         """
-        r = requests.post(self.server + url, data=data, timeout=10)
+        r = self.session.post(self.server + url, data=data, timeout=10)
         if r.status_code != 200:
             if printError:
                 print("POST to {} failed with code {:d}".format(url, r.status_code))
@@ -157,12 +175,12 @@ class Client:
 
     def reset(self):
         """ Reset the test server and delete all data. """
-        r = requests.get(self.server + "reset")
+        r = self.session.get(self.server + "reset")
         return r.status_code == 200
 
     def createMany(self, number : int):
         url = self.server + "test/create/{:d}".format(number)
-        r = requests.get(url)
+        r = self.session.get(url)
         return r.status_code == 200
 
     def addMany(self, contacts):
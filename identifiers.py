@@ -0,0 +1,20 @@
+from os import urandom
+
+def randomIdentifiers(count : int, length : int = 16):
+    """
+    Create random identifiers from a single block of random data.
+
+    Parameters
+    ----------
+    count : int
+        The number of identifiers to create
+    length : int
+        The length of each identifier (in bytes)
+
+    Returns
+    -------
+    list
+        The random identifiers
+    """
+    data = urandom(count * length)
+    return [data[i:i + length] for i in range(0, len(data), length)]
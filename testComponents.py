@@ -7,6 +7,7 @@ from time import time
 # Import the bucket and user set classes
 from userSet import UserSet, ExpiringUserSet
 from bucket import Bucket
+from identifiers import randomIdentifiers
 
 def _randomBytes():
     return urandom(16)
@@ -14,6 +15,10 @@ def _randomBytes():
 def _randomUser():
     return _randomBytes(), _randomBytes()
 
+def _randomUsers(count):
+    data = randomIdentifiers(2 * count)
+    return list(zip(data[0::2], data[1::2]))
+
 def _seconds():
     return int(time())
 
@@ -38,6 +43,22 @@ class TestComponents(unittest.TestCase):
         self.assertFalse(mySet.isValidUser(user, token))
         self.assertEqual(mySet.userCount(), 0)
 
+    def test_user_set_container(self):
+        mySet = UserSet()
+
+        user, token = _randomUser()
+        self.assertNotIn(user, mySet)
+        self.assertEqual(len(mySet), 0)
+
+        mySet.addUser(user, token)
+        self.assertIn(user, mySet)
+        self.assertEqual(len(mySet), 1)
+        self.assertEqual(list(mySet), [user])
+
+        mySet.removeUser(user)
+        self.assertNotIn(user, mySet)
+        self.assertEqual(len(mySet), 0)
+
     def test_user_set_remove_missing(self):
         mySet = UserSet()
 
@@ -111,20 +132,29 @@ class TestComponents(unittest.TestCase):
         self.assertFalse(mySet.isValidUser(user3, token3))
         self.assertEqual(mySet.userCount(), 0)
 
+    def test_user_set_add_many(self):
+        mySet = UserSet()
+
+        users = dict(_randomUsers(100))
+        mySet.addUsers(users)
+        self.assertEqual(mySet.userCount(), 100)
+        for user, token in users.items():
+            self.assertTrue(mySet.isValidUser(user, token))
+            self.assertFalse(mySet.isValidUser(user, _randomBytes()))
+
     def test_user_set_intersection(self):
         mySet = UserSet()
 
         # Add 1000 users
         users = set()
-        for i in range(1000):
-            user, token = _randomUser()
+        for user, token in _randomUsers(1000):
             mySet.addUser(user, token)
             users.add(user)
 
         self.assertEqual(mySet.userCount(), 1000)
 
         # Create 1000 non-existing users
-        other = [ _randomBytes() for x in range(1000) ]
+        other = randomIdentifiers(1000)
 
         # Sample users and others 100 times
         for i in range(100):
@@ -144,6 +174,19 @@ class TestComponents(unittest.TestCase):
             self.assertEqual(len(b - a), 0)
 
 
+    def test_user_set_intersection_larger_query(self):
+        mySet = UserSet()
+
+        users = randomIdentifiers(10)
+        mySet.addUsers({user: _randomBytes() for user in users})
+
+        # Query more users than the set contains, as a set and as a list
+        query = users[:5] + randomIdentifiers(1000)
+        self.assertEqual(set(mySet.containedUsers(set(query))), set(users[:5]))
+        self.assertEqual(set(mySet.containedUsers(frozenset(query))), set(users[:5]))
+        self.assertEqual(set(mySet.containedUsers(query)), set(users[:5]))
+
+
     # MARK: Expiring set tests
 
     def test_exp_set_add_remove(self):
@@ -157,6 +200,21 @@ class TestComponents(unittest.TestCase):
         mySet.removeUser(user)
         self.assertEqual(mySet.userCount(), 0)
 
+    def test_exp_set_container(self):
+        mySet = ExpiringUserSet(expiration_time=86400)
+
+        user = _randomBytes()
+        self.assertNotIn(user, mySet)
+
+        mySet.addUser(user, 1234)
+        self.assertIn(user, mySet)
+        self.assertEqual(len(mySet), 1)
+        self.assertEqual(list(mySet), [user])
+
+        mySet.update(1234 + 86400)
+        self.assertNotIn(user, mySet)
+        self.assertEqual(len(mySet), 0)
+
     def test_exp_set_remove_missing(self):
         mySet = ExpiringUserSet(expiration_time=86400)
         self.assertEqual(mySet.userCount(), 0)
@@ -201,6 +259,20 @@ class TestComponents(unittest.TestCase):
         mySet.removeUser(user3)
         self.assertEqual(mySet.userCount(), 0)
 
+    def test_exp_set_add_remove_many(self):
+        mySet = ExpiringUserSet(expiration_time=86400)
+
+        users = randomIdentifiers(100)
+        mySet.addUsers(users, 1234)
+        self.assertEqual(mySet.userCount(), 100)
+
+        # Removing users not in the set is ignored
+        mySet.removeUsers(users[:50] + randomIdentifiers(10))
+        self.assertEqual(mySet.userCount(), 50)
+
+        self.assertEqual(mySet.update(1234 + 86400), 50)
+        self.assertEqual(mySet.userCount(), 0)
+
     def test_exp_set_update_set(self):
         mySet = ExpiringUserSet(expiration_time=86400)
         self.assertEqual(mySet.userCount(), 0)
@@ -220,20 +292,57 @@ class TestComponents(unittest.TestCase):
         self.assertEqual(len(remaining), 1)
         self.assertEqual(remaining, [user1])
 
+    def test_exp_set_update_readded(self):
+        mySet = ExpiringUserSet(expiration_time=86400)
+
+        user1 = _randomBytes()
+        user2 = _randomBytes()
+        mySet.addUser(user1, 1234)
+        mySet.addUser(user2, 1234)
+
+        # Add the first user again, and remove and add the second user again
+        mySet.addUser(user1, 12345)
+        mySet.removeUser(user2)
+        mySet.addUser(user2, 12345)
+        self.assertEqual(mySet.userCount(), 2)
+
+        # The earlier times must not remove the users
+        self.assertEqual(mySet.update(1235 + 86400), 0)
+        self.assertEqual(mySet.userCount(), 2)
+
+        self.assertEqual(mySet.update(12345 + 86400), 2)
+        self.assertEqual(mySet.userCount(), 0)
+
+    def test_exp_set_contained_expired(self):
+        mySet = ExpiringUserSet(expiration_time=86400)
+
+        user1 = _randomBytes()
+        mySet.addUser(user1, 1234)
+
+        user2 = _randomBytes()
+        mySet.addUser(user2, 12345)
+
+        # Expired users are ignored before the set is updated
+        remaining = mySet.containedUsers([user1, user2], time=1234 + 86400)
+        self.assertEqual(remaining, [user2])
+        self.assertEqual(mySet.userCount(), 2)
+
+        remaining = mySet.containedUsers([user1, user2], time=12345 + 86400)
+        self.assertEqual(len(remaining), 0)
+
     def test_exp_set_intersection(self):
         mySet = ExpiringUserSet(expiration_time=86400)
 
         # Add 1000 users
         users = set()
-        for i in range(1000):
-            user = _randomBytes()
+        for user in randomIdentifiers(1000):
             mySet.addUser(user, randrange(86400))
             users.add(user)
 
         self.assertEqual(mySet.userCount(), 1000)
 
         # Create 1000 non-existing users
-        other = [ _randomBytes() for x in range(1000) ]
+        other = randomIdentifiers(1000)
 
         # Sample users and others 100 times
         for i in range(100):
@@ -260,6 +369,20 @@ class TestComponents(unittest.TestCase):
         user = _randomBytes()
         self.assertTrue(myBucket.userCanSyncAmount(user, 20000, 1234))
 
+    def test_bucket_initial_sync_uneven(self):
+        # The drain periods are not multiples of the bucket sizes
+        myBucket = Bucket(19006, drain_period=86400)
+        user = _randomBytes()
+        self.assertTrue(myBucket.userCanSyncAmount(user, 19006, 1234))
+        self.assertFalse(myBucket.userCanSyncAmount(user, 1, 1234))
+
+        myBucket = Bucket(147, drain_period=10)
+        user = _randomBytes()
+        self.assertTrue(myBucket.userCanSyncAmount(user, 147, 0))
+
+        # A drained bucket also accepts a full sync again
+        self.assertTrue(myBucket.userCanSyncAmount(user, 147, 11))
+
     def test_bucket_initial_too_large(self):
         myBucket = Bucket(20000, drain_period=86400)
 
@@ -282,6 +405,17 @@ class TestComponents(unittest.TestCase):
         self.assertTrue(myBucket.userCanSyncAmount(user, 10000, 1235))
         self.assertFalse(myBucket.userCanSyncAmount(user, 10000, 1236))
 
+    def test_bucket_size_drained(self):
+        myBucket = Bucket(20000, drain_period=86400)
+
+        user = _randomBytes()
+        self.assertEqual(myBucket.currentSizeForUser(user, 1234), 0)
+        self.assertTrue(myBucket.userCanSyncAmount(user, 20000, 1234))
+        self.assertEqual(myBucket.currentSizeForUser(user, 1234), 20000)
+        self.assertEqual(myBucket.currentSizeForUser(user, 1234+43200), 10000)
+        self.assertEqual(myBucket.currentSizeForUser(user, 1234+86400), 0)
+        self.assertEqual(myBucket.currentSizeForUser(user, 1234+100000), 0)
+
     def text_bucket_drain(self):
         myBucket = Bucket(20000, drain_period=86400)
 
@@ -5,7 +5,9 @@ from os import urandom
 from random import sample, shuffle
 from time import sleep, time
 
+import Messages_pb2
 from client import Client
+from identifiers import randomIdentifiers
 
 
 def _newID():
@@ -37,7 +39,7 @@ class TestSystem(unittest.TestCase):
         client = Client()
         self.assertTrue(client.register())
 
-        ids = [_newID() for x in range(10000) ]
+        ids = randomIdentifiers(10000)
         result = client.fullDiscovery(ids)
         self.assertFalse(result is None)
         self.assertEqual(len(result), 0)
@@ -46,12 +48,12 @@ class TestSystem(unittest.TestCase):
         client = Client()
         self.assertTrue(client.register())
 
-        others = [_newID() for x in range(1000) ]
+        others = randomIdentifiers(1000)
         self.assertTrue(client.addMany(others))
 
         for i in range(20):
             s = sample(others, 100)
-            missing = [_newID() for x in range(900) ]
+            missing = randomIdentifiers(900)
             all = s + missing
             shuffle(all)
             result = client.fullDiscovery(all)
@@ -66,7 +68,7 @@ class TestSystem(unittest.TestCase):
     def test_full_sync_limit(self):
         client = Client()
         self.assertTrue(client.register())
-        ids = [_newID() for x in range(1000) ]
+        ids = randomIdentifiers(1000)
         for i in range(20):
             result = client.fullDiscovery(ids)
             self.assertFalse(result is None)
@@ -79,7 +81,7 @@ class TestSystem(unittest.TestCase):
         client = Client()
         self.assertTrue(client.register())
 
-        ids = [_newID() for x in range(10000) ]
+        ids = randomIdentifiers(10000)
         result = client.incrementalDiscovery(ids)
         self.assertFalse(result is None)
         self.assertEqual(len(result), 2)
@@ -90,7 +92,7 @@ class TestSystem(unittest.TestCase):
         client = Client()
         self.assertTrue(client.register())
 
-        existing = [_newID() for x in range(20000) ]
+        existing = randomIdentifiers(20000)
         self.assertTrue(client.addMany(existing))
 
         deleted = list()
@@ -103,7 +105,7 @@ class TestSystem(unittest.TestCase):
         for i in range(20):
             e = sample(existing, 100)
             d = sample(deleted, 100)
-            missing = [_newID() for x in range(800) ]
+            missing = randomIdentifiers(800)
             all = e + d + missing
             shuffle(all)
             result = client.incrementalDiscovery(all)
@@ -118,7 +120,7 @@ class TestSystem(unittest.TestCase):
         client = Client()
         self.assertTrue(client.register())
 
-        ids = [_newID() for x in range(20000) ]
+        ids = randomIdentifiers(20000)
         result = client.incrementalDiscovery(ids)
         self.assertFalse(result is None)
 
@@ -129,7 +131,7 @@ class TestSystem(unittest.TestCase):
         client = Client()
         self.assertTrue(client.register())
 
-        ids = [_newID() for x in range(20000) ]
+        ids = randomIdentifiers(20000)
         result = client.incrementalDiscovery(ids)
         self.assertFalse(result is None)
 
@@ -146,7 +148,7 @@ class TestSystem(unittest.TestCase):
         client = Client()
         self.assertTrue(client.register())
 
-        ids = [_newID() for x in range(20000) ]
+        ids = randomIdentifiers(20000)
         result = client.fullDiscovery(ids)
         self.assertFalse(result is None)
 
@@ -159,6 +161,48 @@ class TestSystem(unittest.TestCase):
         result = client.incrementalDiscovery(ids)
         self.assertFalse(result is None)
 
+    def _postPacked(self, client, packed):
+        request = Messages_pb2.Request(user=client.user, auth_token=client.auth_token, identifiers_packed=packed)
+        r = client.session.post(client.server + "discovery/full", data=request.SerializeToString(), timeout=10)
+        self.assertEqual(r.status_code, 200)
+        response = Messages_pb2.Response()
+        response.ParseFromString(r.content)
+        return response.result
+
+    def test_packed_invalid_length(self):
+        client = Client()
+        self.assertTrue(client.register())
+
+        packed = b''.join(randomIdentifiers(100)) + urandom(5)
+        self.assertEqual(self._postPacked(client, packed), Messages_pb2.Result.REQUEST_DATA_INVALID)
+
+    def test_packed_too_many(self):
+        client = Client()
+        self.assertTrue(client.register())
+
+        packed = b''.join(randomIdentifiers(20001))
+        self.assertEqual(self._postPacked(client, packed), Messages_pb2.Result.RATE_LIMIT_EXCEEDED)
+
+        # The rejected request must not use the rate limit
+        self.assertFalse(client.fullDiscovery(randomIdentifiers(20000)) is None)
+
+    def test_packed_too_many_unauthenticated(self):
+        client = Client()
+
+        packed = b''.join(randomIdentifiers(20001))
+        self.assertEqual(self._postPacked(client, packed), Messages_pb2.Result.AUTHENTICATION_INVALID)
+
+    def test_add_many_packed_too_many(self):
+        client = Client()
+        self.assertTrue(client.register())
+
+        others = randomIdentifiers(20001)
+        self.assertTrue(client.addMany(others))
+
+        result = client.fullDiscovery(others[:100])
+        self.assertFalse(result is None)
+        self.assertEqual(len(result), 100)
+
     def test_create_millions_of_users(self):
         client = Client()
         self.assertTrue(client.createMany(10000000))
@@ -168,7 +212,7 @@ class TestSystem(unittest.TestCase):
         for client in clients:
             self.assertTrue(client.register())
 
-        ids = [_newID() for x in range(20000) ]
+        ids = randomIdentifiers(20000)
         self.assertTrue(client.addMany(ids))
 
         # Test with almost empty server
@@ -1,8 +1,28 @@
+from hashlib import blake2b
+from heapq import heappush, heappop
+from hmac import compare_digest
+from math import ceil
+
+
+def _hashToken(auth_token):
+    """ Hash an authentication token to a fixed length digest (16 bytes). """
+    return blake2b(auth_token, digest_size=16).digest()
+
+def _containedKeys(dictionary, users):
+    """ Get the users which are keys of a dictionary, iterating over the smaller of both. """
+    # The intersection of a set iterates over its argument,
+    # while the intersection of the key view iterates over the users
+    if isinstance(users, (set, frozenset)) and len(dictionary) < len(users):
+        return users.intersection(dictionary)
+    return dictionary.keys() & users
+
 
 class UserSet:
     """
     A set of users with their authentication tokens.
 
+    Only hashes of the authentication tokens are stored.
+
     Methods
     -------
     userCount()
@@ -11,10 +31,16 @@ class UserSet:
         Check if a user exists in the set.
     addUser(user, auth_token)
         Add a user to the set.
+    addUsers(users)
+        Add many users to the set.
     removeUser(user):
         Remove a user from the set.
     isValidUser(user, auth_token):
         Check if the authentication token of a user is valid.
+    containedUsers(users):
+        Check which users are contained in the set.
+    containedUsersSet(users):
+        Get the set of users which are contained in the set.
     clear()
         Remove all users from the set.
     """
@@ -27,6 +53,18 @@ class UserSet:
         """ Get the number of users in the set. """
         return len(self._users)
 
+    def __len__(self):
+        """ Get the number of users in the set. """
+        return len(self._users)
+
+    def __contains__(self, user):
+        """ Check if a user exists in the set. """
+        return user in self._users
+
+    def __iter__(self):
+        """ Iterate over the identifiers of the users in the set. """
+        return iter(self._users)
+
     def userExists(self, user):
         """
         Check if a user exists in the set.
@@ -41,7 +79,7 @@ class UserSet:
         bool
             True, if the user exists
         """
-        return self._users.get(user) is not None
+        return user in self._users
 
     def addUser(self, user, auth_token):
         """
@@ -51,8 +89,21 @@ class UserSet:
         ----------
         user : bytes
             The identifier of the user
+        auth_token : bytes
+            The authentication token of the user
+        """
+        self._users[user] = _hashToken(auth_token)
+
+    def addUsers(self, users):
+        """
+        Add many users to the set.
+
+        Parameters
+        ----------
+        users : dict
+            The identifiers of the users as keys, their authentication tokens as values
         """
-        self._users[user] = auth_token
+        self._users.update(zip(users.keys(), map(_hashToken, users.values())))
 
     def removeUser(self, user):
         """
@@ -63,9 +114,7 @@ class UserSet:
         user : bytes
             The identifier of the user
         """
-        if user not in self._users:
-            return
-        del self._users[user]
+        self._users.pop(user, None)
 
     def isValidUser(self, user, auth_token):
         """
@@ -83,10 +132,13 @@ class UserSet:
         bool
             True, if the user and auth_token are valid
         """
-        storedToken = self._users.get(user)
-        if storedToken is None:
+        # Requests of registered users are the common case
+        try:
+            storedToken = self._users[user]
+        except KeyError:
             return False
-        return storedToken == auth_token
+        # Compare the digests in constant time
+        return compare_digest(storedToken, _hashToken(auth_token))
 
     def containedUsers(self, users):
         """
@@ -100,9 +152,27 @@ class UserSet:
         Returns
         -------
         list
+            The identifiers of the users which where found in the set, in no particular order.
+        """
+        return list(_containedKeys(self._users, users))
+
+    def containedUsersSet(self, users):
+        """
+        Get the set of users which are contained in the set.
+
+        The result is not copied into a list, and can be combined with other sets.
+
+        Parameters
+        ----------
+        users : set or list
+            The identifiers of the users to check
+
+        Returns
+        -------
+        set
             The identifiers of the users which where found in the set.
         """
-        return [x for x in users if x in self._users]
+        return _containedKeys(self._users, users)
 
     def clear(self):
         """ Remove all users from the set. """
@@ -113,10 +183,15 @@ class ExpiringUserSet:
     """
     A set of users where the users are removed after an expiration time.
 
+    Expired users are only removed by calling 'update()'. Until then, they are
+    still counted, but can be excluded when checking contained users.
+
     Attributes
     ----------
     expiration_time : int
         The time after which users are removed from the set
+    bucket_count : int
+        The number of intervals into which 'expiration_time' is divided to group expiring users
 
     Methods
     -------
@@ -126,17 +201,23 @@ class ExpiringUserSet:
         Check if a user exists in the set.
     addUser(identifier, time)
         Add a user to the set.
+    addUsers(identifiers, time)
+        Add many users to the set.
     removeUser(identifier)
         Remove a user from the set.
-    containedUsers(identifiers):
+    removeUsers(identifiers)
+        Remove many users from the set.
+    containedUsers(identifiers, time):
         Check which users are contained in the set.
+    containedUsersSet(identifiers, time):
+        Get the set of users which are contained in the set.
     update(time)
         Update the set to remove users whose times have elapsed.
     clear()
         Remove all users from the set.
     """
 
-    def __init__(self, expiration_time : int):
+    def __init__(self, expiration_time : int, bucket_count : int = 256):
         """
         Create a new user set.
 
@@ -144,14 +225,39 @@ class ExpiringUserSet:
         ----------
         expiration_time : int
             The time interval after which users should be removed from the set.
+        bucket_count : int
+            The number of intervals into which 'expiration_time' is divided to group expiring users.
         """
         self._users = dict()
+        # The users grouped by intervals of their removal times
+        # The keys are the interval indices, the values are sets of users.
+        # Interval 'i' holds the users with removal times in ((i - 1) * w, i * w],
+        # where 'w' is the width of an interval.
+        # Removed or re-added users stay in their old bucket,
+        # and are skipped when their removal time in '_users' has not yet elapsed.
+        self._buckets = dict()
+        # Min-heap of the interval indices of all buckets
+        self._expirations = []
         self.expiration_time = expiration_time
+        self.bucket_count = bucket_count
+        self._bucket_width = expiration_time / bucket_count
 
     def userCount(self):
         """ Get the number of users in the set. """
         return len(self._users)
 
+    def __len__(self):
+        """ Get the number of users in the set. """
+        return len(self._users)
+
+    def __contains__(self, user):
+        """ Check if a user exists in the set. """
+        return user in self._users
+
+    def __iter__(self):
+        """ Iterate over the identifiers of the users in the set. """
+        return iter(self._users)
+
     def userExists(self, user):
         """
         Check if a user exists in the set.
@@ -166,7 +272,7 @@ class ExpiringUserSet:
         bool
             True, if the user exists
         """
-        return self._users.get(user) is not None
+        return user in self._users
 
     def addUser(self, user, time : int):
         """
@@ -181,6 +287,32 @@ class ExpiringUserSet:
         """
         removal_time = time + self.expiration_time
         self._users[user] = removal_time
+        self._bucket(removal_time).add(user)
+
+    def addUsers(self, users, time : int):
+        """
+        Add many users to the set.
+
+        Parameters
+        ----------
+        users : list
+            The identifiers of the users
+        time : int
+            The current time in seconds since epoch
+        """
+        removal_time = time + self.expiration_time
+        self._users.update(dict.fromkeys(users, removal_time))
+        self._bucket(removal_time).update(users)
+
+    def _bucket(self, removal_time : int):
+        """ Get the bucket of users for a removal time, or create it if needed. """
+        index = ceil(removal_time / self._bucket_width)
+        bucket = self._buckets.get(index)
+        if bucket is None:
+            bucket = set()
+            self._buckets[index] = bucket
+            heappush(self._expirations, index)
+        return bucket
 
     def removeUser(self, user):
         """
@@ -191,11 +323,22 @@ class ExpiringUserSet:
         identifier : bytes
             The identifier of the user
         """
-        if user not in self._users:
-            return
-        del self._users[user]
+        self._users.pop(user, None)
 
-    def containedUsers(self, users):
+    def removeUsers(self, users):
+        """
+        Remove many users from the set.
+
+        Parameters
+        ----------
+        users : list
+            The identifiers of the users
+        """
+        # Only visit the users which are actually in the set
+        for user in self._users.keys() & users:
+            del self._users[user]
+
+    def containedUsers(self, users, time : int = None):
         """
         Check which users are contained in the set.
 
@@ -203,13 +346,42 @@ class ExpiringUserSet:
         ----------
         users : list
             The identifiers of the users to check
+        time : int
+            The current time in seconds since epoch, to exclude expired users.
+            Passing None will include all users not yet removed by 'update()'.
 
         Returns
         -------
         list
+            The identifiers of the users which where found in the set, in no particular order.
+        """
+        return list(self.containedUsersSet(users, time))
+
+    def containedUsersSet(self, users, time : int = None):
+        """
+        Get the set of users which are contained in the set.
+
+        The result is not copied into a list, and can be combined with other sets.
+
+        Parameters
+        ----------
+        users : set or list
+            The identifiers of the users to check
+        time : int
+            The current time in seconds since epoch, to exclude expired users.
+            Passing None will include all users not yet removed by 'update()'.
+
+        Returns
+        -------
+        set
             The identifiers of the users which where found in the set.
         """
-        return [x for x in users if x in self._users]
+        found = _containedKeys(self._users, users)
+        if time is None:
+            return found
+        # Only check the expiration of the users that were found
+        removal_times = self._users
+        return {user for user in found if removal_times[user] > time}
 
     def update(self, time : int):
         """
@@ -225,14 +397,35 @@ class ExpiringUserSet:
         int
             The number of removed items
         """
-        filtered = dict()
-        for k, v in self._users.items():
-            if v > time:
-                filtered[k] = v
-        removed = len(self._users) - len(filtered)
-        self._users = filtered
+        # Only the buckets at the top of the heap are visited
+        removed = 0
+        expirations = self._expirations
+        width = self._bucket_width
+        while expirations:
+            index = expirations[0]
+            if index * width <= time:
+                # All users of the bucket have expired
+                heappop(expirations)
+                expired = self._buckets.pop(index)
+            elif (index - 1) * width < time:
+                # Only some users of the bucket have expired, the others stay in the bucket
+                bucket = self._buckets[index]
+                expired = [user for user in bucket if self._users.get(user, time) <= time]
+                bucket.difference_update(expired)
+            else:
+                break
+            for user in expired:
+                # Skip users that were removed or added again
+                removal_time = self._users.get(user)
+                if removal_time is not None and removal_time <= time:
+                    del self._users[user]
+                    removed += 1
+            if index * width > time:
+                break
         return removed
 
     def clear(self):
         """ Remove all users from the set. """
         self._users.clear()
+        self._buckets.clear()
+        self._expirations.clear()